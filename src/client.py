@@ -1,20 +1,27 @@
 """LangChain-powered MCP client with Azure OpenAI and ReAct agent integration."""
 
 import asyncio
+import hashlib
+import json
 import logging
+import math
 import os
-from typing import List, cast
-from contextlib import AsyncExitStack
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple, cast
+from contextlib import AsyncExitStack, suppress
 
+import httpx
 from dotenv import load_dotenv
-from langchain_core.messages import AIMessage
-from langchain_core.tools import BaseTool, tool
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import BaseTool, StructuredTool, tool
 from langchain_core.runnables import RunnableConfig
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain_mcp_adapters.sessions import StreamableHttpConnection
-from langchain_openai import AzureChatOpenAI
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
+from pydantic import BaseModel, Field
 
 load_dotenv()
 
@@ -27,39 +34,187 @@ logging.basicConfig(
 
 logger = logging.getLogger("cosmos_mcp_client")
 
+TOOLS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mcp")
+# Seconds before cached tool schemas are re-read from the server
+TOOLS_CACHE_TTL = 3600
+
+def _tools_cache_path(connections: Dict[str, Any]) -> str:
+	"""Return the on-disk tool schema cache file for the given server connections.
+
+	The key covers the full connection config and, for stdio servers, the mtime of
+	any script passed as an argument so that editing the server invalidates the cache.
+	"""
+	key_parts: List[Any] = [connections]
+	for connection in connections.values():
+		for arg in connection.get("args") or []:
+			if os.path.isfile(arg):
+				key_parts.append((arg, os.path.getmtime(arg)))
+	key = json.dumps(key_parts, sort_keys=True, default=str)
+	digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+	return os.path.join(TOOLS_CACHE_DIR, f"{digest}.json")
+
+def _load_tools_cache(path: str) -> Optional[List[Dict[str, Any]]]:
+	"""Return the cached tool specs, or None if the cache is missing, expired or unreadable.
+
+	Remote servers can be redeployed without any local change, so entries older than
+	TOOLS_CACHE_TTL are treated as stale and the schemas are fetched again.
+	"""
+	try:
+		if time.time() - os.path.getmtime(path) > TOOLS_CACHE_TTL:
+			return None
+		with open(path, 'r', encoding='utf-8') as file:
+			specs = json.load(file)
+		return [
+			{"name": spec["name"], "description": spec["description"], "args_schema": spec["args_schema"]}
+			for spec in specs
+		]
+	except FileNotFoundError:
+		return None
+	except (OSError, ValueError, KeyError, TypeError) as e:
+		logger.warning("Ignoring unreadable MCP tool cache %s: %s", path, str(e))
+		return None
+
+def _save_tools_cache(path: str, tools: List[BaseTool]):
+	"""Write the tool specs atomically so an interrupted run never leaves a partial file."""
+	specs = [
+		{
+			"name": t.name,
+			"description": t.description,
+			"args_schema": t.args_schema if isinstance(t.args_schema, dict) else t.args_schema.model_json_schema(),
+		}
+		for t in tools
+	]
+	tmp_path = f"{path}.{os.getpid()}.tmp"
+	try:
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(tmp_path, 'w', encoding='utf-8') as file:
+			json.dump(specs, file)
+		os.replace(tmp_path, path)
+	except (OSError, TypeError, ValueError) as e:
+		logger.warning("Could not write MCP tool cache %s: %s", path, str(e))
+		with suppress(OSError):
+			os.remove(tmp_path)
+
+def _drop_tools_cache(path: str):
+	"""Remove the tool cache so the next start fetches fresh schemas."""
+	try:
+		os.remove(path)
+	except FileNotFoundError:
+		pass
+	except OSError as e:
+		logger.warning("Could not remove MCP tool cache %s: %s", path, str(e))
+
+class _ToolInput(BaseModel):
+	"""Input schema shared by every wrapped MCP tool."""
+	query: str = Field(description="Input to pass to the MCP tool")
+
+def _make_sync_tool(mcp_tool: BaseTool) -> BaseTool:
+	"""Wrap an MCP tool as a single-input LangChain tool named after the MCP tool."""
+
+	# Reuse the module-level schema instead of inferring a new Pydantic model per tool
+	@tool(mcp_tool.name, description=mcp_tool.description, args_schema=_ToolInput)
+	async def _fn(query: str) -> str:
+		"""Execute the MCP tool with the given input."""
+		result = await mcp_tool.ainvoke({"query": query})
+		return str(result)
+
+	return _fn
+
+class SemanticCache:
+	"""Bounded LRU of (query embedding, response) pairs matched by cosine similarity.
+
+	Entries expire after ttl seconds, matching the server's search cache, so stale
+	prices and stock levels are not served once the server has refreshed.
+	"""
+
+	def __init__(self, embeddings: AzureOpenAIEmbeddings, maxsize: int = 128, threshold: float = 0.95, ttl: float = 60.0):
+		self.embeddings = embeddings
+		self.threshold = threshold
+		self.ttl = ttl
+		# Entries are (scope, unit-length embedding, response, expiry), most recently used last
+		self._entries: Deque[Tuple[int, List[float], str, float]] = deque(maxlen=maxsize)
+
+	async def embed(self, query: str) -> List[float]:
+		"""Embed the query and normalize it so a dot product gives the cosine similarity"""
+		vector = await self.embeddings.aembed_query(query)
+		norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+		return [x / norm for x in vector]
+
+	def lookup(self, scope: int, vector: List[float]) -> Optional[str]:
+		"""Return the cached response most similar to the vector above the threshold, if any"""
+		now = time.monotonic()
+		# Hits keep their original expiry, so purge by timestamp rather than by position
+		if any(entry[3] <= now for entry in self._entries):
+			self._entries = deque((entry for entry in self._entries if entry[3] > now), maxlen=self._entries.maxlen)
+		best = None
+		best_similarity = self.threshold
+		for entry in self._entries:
+			if entry[0] != scope:
+				continue
+			similarity = sum(a * b for a, b in zip(entry[1], vector))
+			if similarity > best_similarity:
+				best, best_similarity = entry, similarity
+		if best is None:
+			return None
+		self._entries.remove(best)
+		self._entries.append(best)
+		return best[2]
+
+	def store(self, scope: int, vector: List[float], response: str):
+		"""Cache a response, evicting the least recently used entry when full"""
+		self._entries.append((scope, vector, response, time.monotonic() + self.ttl))
+
 class MCPClient:
 	"""LangChain-powered MCP client with Azure OpenAI and ReAct agent integration."""
 
 	def __init__(self):
 		# Initialize MultiServerMCPClient with StdioConnection
-		self.mcp_client = MultiServerMCPClient(
-			{
-				# "local": StdioConnection(
-				# 	transport="stdio",
-				# 	command="python3",
-				# 	args=["src/server.py"],
-				# 	env=None,
-				# 	cwd=None,
-				# 	encoding="utf-8",
-				# 	encoding_error_handler="strict",
-				# 	session_kwargs=None
-				# ),
-				"remote": StreamableHttpConnection(
-					transport="streamable_http",
-					url="https://remote-db-mcp-server.calmcoast-50b9e43c.eastus.azurecontainerapps.io/mcp",
-				)
-			}
-		)
+		self.connections = {
+			# "local": StdioConnection(
+			# 	transport="stdio",
+			# 	command="python3",
+			# 	args=["src/server.py"],
+			# 	env=None,
+			# 	cwd=None,
+			# 	encoding="utf-8",
+			# 	encoding_error_handler="strict",
+			# 	session_kwargs=None
+			# ),
+			"remote": StreamableHttpConnection(
+				transport="streamable_http",
+				url="https://remote-db-mcp-server.calmcoast-50b9e43c.eastus.azurecontainerapps.io/mcp",
+			)
+		}
+		self.mcp_client = MultiServerMCPClient(self.connections)
 		self.exit_stack = AsyncExitStack()
 
+		# Keep TLS sessions to Azure OpenAI alive between requests
+		self.http_client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20))
+		self.exit_stack.push_async_callback(self.http_client.aclose)
+
 		# Initialize Azure OpenAI
 		self.llm = AzureChatOpenAI(
 			azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
 			api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
-			temperature=0
+			temperature=0,
+			http_async_client=self.http_client
 		)
+		self._warmup_task: Optional[asyncio.Task] = None
+
+		# Serve near-duplicate queries without an agent run when an embedding deployment is configured
+		embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+		self.semantic_cache: Optional[SemanticCache] = None
+		if embedding_deployment:
+			self.semantic_cache = SemanticCache(AzureOpenAIEmbeddings(
+				azure_deployment=embedding_deployment,
+				api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+			))
 
 		self.tools: List[BaseTool] = []
+		self._tools_fingerprint = 0
+		self.system_prompt: Optional[str] = None
+		self._live_tools: Dict[str, BaseTool] = {}
+		self.tools_cache_path = _tools_cache_path(self.connections)
 		self.agent = None
 
 		# System instruction for the agent
@@ -72,18 +227,70 @@ class MCPClient:
 	async def connect_to_server(self):
 		"""Connect to the MCP server
 		"""
-		# Get the tools from the MCP client
-		self.tools = await self.mcp_client.get_tools()
+		# Open the Azure OpenAI connection in the background so the first query finds a warm pool
+		self._warmup_task = asyncio.create_task(self._warm_up_llm())
+
+		# Get the tools from the on-disk cache, falling back to the MCP handshake
+		specs = _load_tools_cache(self.tools_cache_path)
+		if specs is not None:
+			logger.info("Loading MCP tool schemas from cache: %s", self.tools_cache_path)
+			self.tools = [self._cached_tool(spec) for spec in specs]
+		else:
+			self.tools = await self._fetch_live_tools()
+			_save_tools_cache(self.tools_cache_path, self.tools)
+
+		# Cached responses are scoped to the tool set so that tool changes invalidate them
+		self._tools_fingerprint = hash(tuple(sorted(t.name for t in self.tools)))
 
 		# Create ReAct agent using the new tooling logic
 		self.agent = await self._create_azure_mcp_agent()
 
 		print("\nConnected to server with tools:", [tool.name + ": " + tool.description for tool in self.tools])
 
+	async def _warm_up_llm(self):
+		"""Send a one-token completion so DNS, TCP and TLS setup happen before the first query"""
+		try:
+			await self.llm.ainvoke([HumanMessage(content="ping")], max_tokens=1)
+		except Exception as e:
+			logger.warning("Azure OpenAI warm-up failed: %s", str(e))
+
 	async def get_tools(self) -> List[BaseTool]:
 		"""Get the available MCP tools"""
 		return self.tools
 
+	async def _fetch_live_tools(self) -> List[BaseTool]:
+		"""Fetch the tools from the MCP server once per process and memoize them by name"""
+		if not self._live_tools:
+			tools = await self.mcp_client.get_tools()
+			self._live_tools = {t.name: t for t in tools}
+		return list(self._live_tools.values())
+
+	def _cached_tool(self, spec: Dict[str, Any]) -> BaseTool:
+		"""
+		Build a lightweight tool from a cached schema that binds to the live MCP tool
+		on its first invocation.
+		"""
+		name = spec["name"]
+
+		async def _call(**kwargs):
+			await self._fetch_live_tools()
+			if name not in self._live_tools:
+				# The server no longer offers this tool: the cache is stale, so drop it
+				# and re-fetch in case the tool was only just redeployed
+				_drop_tools_cache(self.tools_cache_path)
+				self._live_tools = {}
+				await self._fetch_live_tools()
+				if name not in self._live_tools:
+					return f"Error: tool '{name}' is no longer available on the MCP server."
+			return await self._live_tools[name].ainvoke(kwargs)
+
+		return StructuredTool.from_function(
+			coroutine=_call,
+			name=name,
+			description=spec["description"],
+			args_schema=spec["args_schema"],
+		)
+
 	async def _create_azure_mcp_agent(self):
 		"""
 		Creates and returns an agent that interacts with Azure MCP server.
@@ -93,59 +300,84 @@ class MCPClient:
 		logger.info("Creating Azure MCP Agent")
 		langchain_mcp_tools = await self.get_tools()
 
-		sync_tools = []
 		for mcp_tool in langchain_mcp_tools:
 			logger.info("Available Langchain MCP tool: %s", mcp_tool.name)
+		sync_tools = [_make_sync_tool(mcp_tool) for mcp_tool in langchain_mcp_tools]
 
-			@tool()
-			async def sync_tool(query: str, mcp_tool=mcp_tool):
-				"""Execute the MCP tool with the given input."""
-				result = await mcp_tool.ainvoke({"query": query})
-				return str(result)
-
-			sync_tools.append(sync_tool)
+		# Render the {tools} placeholder once; the agent prepends the result as its system message
+		rendered_tools = "\n".join(f"- {t.name}: {t.description}" for t in langchain_mcp_tools)
+		self.system_prompt = self.system_instruction.format(tools=rendered_tools)
 
 		azure_mcp_agent = create_react_agent(
 			self.llm,
 			tools=sync_tools,
-			prompt=self.system_instruction,
+			prompt=self.system_prompt,
 		)
 		return azure_mcp_agent
 
-	async def process_query(self, query: str) -> str:
-		"""Process a query using LangChain ReAct agent and available tools"""
+	async def process_query(self, query: str) -> AsyncIterator[str]:
+		"""Process a query using LangChain ReAct agent and available tools, yielding the final answer"""
 		if not self.agent:
-			return "Error: Agent not initialized. Please connect to server first."
+			yield "Error: Agent not initialized. Please connect to server first."
+			return
+
+		vector = None
+		if self.semantic_cache:
+			# The cache is an optimization only; if embedding fails, run the agent as usual
+			try:
+				vector = await self.semantic_cache.embed(query)
+			except Exception as e:
+				logger.warning("Semantic cache lookup failed: %s", str(e))
+			else:
+				cached = self.semantic_cache.lookup(self._tools_fingerprint, vector)
+				if cached is not None:
+					logger.info("Semantic cache hit for query: '%s'", query)
+					yield cached
+					return
 
 		try:
-			# Run the agent with the new message format
+			# Only the final ReAct step carries the answer. Earlier steps end in tool calls,
+			# and any text the model emits before those calls is narration, so each step's
+			# text is held until the run shows whether that step was the last one.
 			context_id = "demo-thread-1"
 			config = cast(RunnableConfig, {'configurable': {'thread_id': context_id}})
-			result = await self.agent.ainvoke(
+			step = None
+			step_tokens: List[str] = []
+			step_calls_tools = False
+			async for chunk, metadata in self.agent.astream(
 				{"messages": [("user", query)]},
-				config=config
-			)
+				config=config,
+				stream_mode="messages"
+			):
+				# Tool results stay internal to the agent
+				if not isinstance(chunk, AIMessage):
+					continue
+				if metadata.get("langgraph_step") != step:
+					step = metadata.get("langgraph_step")
+					step_tokens = []
+					step_calls_tools = False
+				if chunk.tool_calls or getattr(chunk, "tool_call_chunks", None):
+					step_calls_tools = True
+				content = chunk.content
+				if not content:
+					continue
+				if isinstance(content, list):
+					# Handle list content
+					content = str(content[0])
+				elif not isinstance(content, str):
+					content = str(content)
+				step_tokens.append(content)
 
-			# Extract the final response
-			if result and "messages" in result:
-				messages = result["messages"]
-				if messages:
-					# Get the last AI message
-					for message in reversed(messages):
-						if isinstance(message, AIMessage):
-							content = message.content
-							if isinstance(content, str):
-								return content
-							elif isinstance(content, list):
-								# Handle list content
-								return str(content[0]) if content else ""
-							else:
-								return str(content)
-
-			return "No response generated"
+			answer = "" if step_calls_tools else "".join(step_tokens)
+			if not answer:
+				yield "No response generated"
+				return
+			yield answer
+			if vector is not None and self.semantic_cache:
+				self.semantic_cache.store(self._tools_fingerprint, vector, answer)
 
 		except Exception as e:
-			return f"Error processing query: {str(e)}"
+			yield f"Error processing query: {str(e)}"
 
 	async def chat_loop(self):
 		"""Run an interactive chat loop"""
@@ -153,11 +385,19 @@ class MCPClient:
 		print("Type your queries or 'quit' to exit.")
 
 		while True:
-			query = input("\nQuery: ")
-			response = await self.process_query(query)
-			print("\n" + response)
+			# Read input on a worker thread so the event loop keeps running while the user types
+			query = (await asyncio.to_thread(input, "\nQuery: ")).strip()
+			if query.lower() == 'quit':
+				break
+			print()
+			async for token in self.process_query(query):
+				print(token, end="", flush=True)
+			print()
+
 	async def cleanup(self):
 		"""Clean up resources"""
+		if self._warmup_task and not self._warmup_task.done():
+			self._warmup_task.cancel()
 		await self.exit_stack.aclose()
 
 async def main(): 
@@ -0,0 +1,142 @@
+"""Shared Azure Cosmos DB client for the products database."""
+
+import functools
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.cosmos.aio import ContainerProxy, CosmosClient, DatabaseProxy
+from azure.identity.aio import DefaultAzureCredential
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on pooled connections to the Cosmos DB gateway
+MAX_CONNECTIONS = 200
+# Seconds an idle pooled connection is kept open for reuse
+KEEPALIVE_TIMEOUT = 60
+
+@dataclass(frozen=True, slots=True)
+class CosmosConfig:
+    """Cosmos DB configuration, read and validated once from the environment."""
+    endpoint: str
+    database: str = "products-db"
+    container: str = "products"
+    # Seconds to wait for a connection to the Cosmos DB gateway
+    connection_timeout: int = 10
+    # Absolute seconds allowed for a whole operation, including SDK retries
+    request_timeout: int = 10
+
+    @classmethod
+    def from_env(cls) -> "CosmosConfig":
+        """Build the configuration from COSMOS_* environment variables."""
+        endpoint = os.getenv("COSMOS_ENDPOINT")
+        if not endpoint:
+            logger.error("COSMOS_ENDPOINT environment variable is not set")
+            raise ValueError("COSMOS_ENDPOINT environment variables must be set")
+        try:
+            connection_timeout = int(os.getenv("COSMOS_CONNECTION_TIMEOUT", "10"))
+            request_timeout = int(os.getenv("COSMOS_REQUEST_TIMEOUT", "10"))
+        except ValueError as exc:
+            raise ValueError("COSMOS_CONNECTION_TIMEOUT and COSMOS_REQUEST_TIMEOUT must be integer numbers of seconds") from exc
+        return cls(
+            endpoint=endpoint,
+            database=os.getenv("COSMOS_DATABASE", "products-db"),
+            container=os.getenv("COSMOS_CONTAINER", "products"),
+            connection_timeout=connection_timeout,
+            request_timeout=request_timeout,
+        )
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> CosmosConfig:
+    """Return the Cosmos DB configuration, reading the environment on first use."""
+    return CosmosConfig.from_env()
+
+_client: Optional[CosmosClient] = None
+_credential: Optional[DefaultAzureCredential] = None
+_session: Optional[aiohttp.ClientSession] = None
+_database: Optional[DatabaseProxy] = None
+_container: Optional[ContainerProxy] = None
+_client_lock = threading.Lock()
+
+def _create_credential() -> DefaultAzureCredential:
+    """Create a credential limited to the sources this service runs with.
+
+    DefaultAzureCredential probes a long list of sources before finding one that
+    works. Only a service principal or workload identity from the environment, the
+    managed identity of the container app and a local Azure CLI login are kept.
+    AZURE_CLIENT_ID still selects a user-assigned managed identity.
+    """
+    return DefaultAzureCredential(
+        exclude_shared_token_cache_credential=True,
+        exclude_visual_studio_code_credential=True,
+        exclude_powershell_credential=True,
+        exclude_developer_cli_credential=True,
+    )
+
+def get_client() -> CosmosClient:
+    """Return the process-wide Cosmos DB client, creating it on first use."""
+    global _client, _credential, _session, _database, _container
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    config = get_config()
+                    # The Python SDK only supports Gateway mode (Direct/TCP is .NET/Java only),
+                    # so tune what it does expose: Session consistency, the cheapest level that
+                    # still gives read-your-writes, and bounded connection and request timeouts
+                    # so a stalled gateway fails a tool call quickly instead of hanging it.
+                    _credential = _create_credential()
+                    # A shared keep-alive pool reuses TCP/TLS connections across tool calls
+                    # and caps sockets so bursts cannot exhaust ephemeral ports. The session
+                    # must be created on the running event loop, hence on first use.
+                    _session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+                        limit=MAX_CONNECTIONS,
+                        keepalive_timeout=KEEPALIVE_TIMEOUT,
+                        enable_cleanup_closed=True,
+                    ))
+                    client = CosmosClient(
+                        config.endpoint,
+                        credential=_credential,
+                        consistency_level="Session",
+                        connection_timeout=config.connection_timeout,
+                        timeout=config.request_timeout,
+                        transport=AioHttpTransport(session=_session, session_owner=False),
+                    )
+                    _database = client.get_database_client(config.database)
+                    _container = _database.get_container_client(config.container)
+                    _client = client
+                    logger.info("Initialized Cosmos DB client")
+                except Exception as e:
+                    logger.error("Failed to initialize Cosmos DB client: %s", str(e))
+                    raise
+    return _client
+
+def get_database() -> DatabaseProxy:
+    """Return the products database proxy on the shared client."""
+    get_client()
+    return _database
+
+def get_container() -> ContainerProxy:
+    """Return the products container proxy on the shared client."""
+    get_client()
+    return _container
+
+async def close_client():
+    """Close the shared client, its connection pool and credential on the event loop that used them."""
+    global _client, _credential, _session, _database, _container
+    with _client_lock:
+        client, credential, session = _client, _credential, _session
+        _client = _credential = _session = _database = _container = None
+    if client is not None:
+        await client.close()
+    if session is not None:
+        await session.close()
+    if credential is not None:
+        await credential.close()
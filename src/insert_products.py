@@ -1,16 +1,36 @@
 """Module for inserting product JSON documents into Azure Cosmos DB."""
 
-import json
+import asyncio
+import logging
 import os
-from typing import List, Dict, Any
+import time
+from collections import defaultdict
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 
-from azure.cosmos import CosmosClient, PartitionKey
-from azure.identity import DefaultAzureCredential, ClientSecretCredential
+import orjson
+from azure.cosmos import PartitionKey
+from azure.cosmos.aio import CosmosClient
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError
+from azure.identity.aio import DefaultAzureCredential, ClientSecretCredential
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent Cosmos DB write requests
+MAX_CONCURRENT_INSERTS = 32
+
+# Cosmos DB allows at most 100 operations per transactional batch
+MAX_BATCH_OPERATIONS = 100
+
+# Number of inserted products between progress log lines
+PROGRESS_INTERVAL = 100
+
+# Seconds for which container statistics are reused before being read again
+STATS_CACHE_TTL = 60.0
+
 class CosmosDBProductInserter:
     """Handles insertion of product data into Azure Cosmos DB."""
     
@@ -30,42 +50,51 @@ class CosmosDBProductInserter:
         if not self.endpoint:
             raise ValueError("COSMOS_ENDPOINT environment variable is required")
         
-        # Initialize Cosmos DB client with authentication
+        # Initialize Cosmos DB client with authentication. A single async client
+        # (and its connection pool) is reused for every operation.
+        self.credential: Optional[Any] = None
         if self.key:
             # Use key-based authentication
             self.client = CosmosClient(self.endpoint, self.key)
         elif self.client_id and self.client_secret and self.tenant_id:
             # Use service principal authentication
             try:
-                credential = ClientSecretCredential(
+                self.credential = ClientSecretCredential(
                     tenant_id=self.tenant_id,
                     client_id=self.client_id,
                     client_secret=self.client_secret
                 )
-                self.client = CosmosClient(self.endpoint, credential)
+                self.client = CosmosClient(self.endpoint, self.credential)
             except ImportError as exc:
                 raise ValueError("azure-identity package required for service principal authentication. Install with: pip install azure-identity") from exc
         else:
             # Use AAD token authentication with DefaultAzureCredential
             try:
-                credential = DefaultAzureCredential()
-                self.client = CosmosClient(self.endpoint, credential)
+                self.credential = DefaultAzureCredential()
+                self.client = CosmosClient(self.endpoint, self.credential)
             except ImportError as exc:
                 raise ValueError("azure-identity package required for AAD authentication. Install with: pip install azure-identity") from exc
         
         self.database = self.client.get_database_client(self.database_name)
         self.container = self.database.get_container_client(self.container_name)
+        self._stats_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+    
+    async def close(self):
+        """Close the Cosmos DB client and any credential it owns."""
+        await self.client.close()
+        if self.credential is not None:
+            await self.credential.close()
     
-    def create_database_and_container(self):
+    async def create_database_and_container(self):
         """Create the database and container if they don't exist."""
         try:
             # Create database
-            self.database = self.client.create_database_if_not_exists(self.database_name)
+            self.database = await self.client.create_database_if_not_exists(self.database_name)
             print(f"Database '{self.database_name}' ready")
             
             # Create container with partition key on 'category'
             partition_key = PartitionKey(path="/category")
-            self.container = self.database.create_container_if_not_exists(
+            self.container = await self.database.create_container_if_not_exists(
                 id=self.container_name,
                 partition_key=partition_key,
                 offer_throughput=400  # Minimum throughput for shared containers
@@ -79,92 +108,181 @@ class CosmosDBProductInserter:
     def load_products_from_json(self, file_path: str = "src/db.json") -> List[Dict[str, Any]]:
         """Load products from the JSON file."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                products = json.load(file)
+            with open(file_path, 'rb') as file:
+                products = orjson.loads(file.read())
             print(f"Loaded {len(products)} products from {file_path}")
             return products
         except FileNotFoundError:
             print(f"Error: File {file_path} not found")
             raise
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"Error parsing JSON: {e}")
             raise
     
-    def insert_products(self, products: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Insert products into Cosmos DB and return statistics."""
+    async def insert_products(self, products: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Insert products into Cosmos DB in per-category batches and return statistics."""
         stats: Dict[str, Any] = {
             'successful': 0,
             'failed': 0,
             'errors': []
         }
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_INSERTS)
         
-        for product in products:
+        def record_success(product: Dict[str, Any]):
+            stats['successful'] += 1
+            logger.debug("Inserted product: %s (ID: %s)", product['name'], product['id'])
+            if stats['successful'] % PROGRESS_INTERVAL == 0:
+                logger.info("Inserted %s products so far", stats['successful'])
+        
+        async def insert_one(product: Dict[str, Any]):
             try:
                 # Insert the product document
-                self.container.create_item(product)
-                stats['successful'] += 1
-                print(f"✓ Inserted product: {product['name']} (ID: {product['id']})")
+                await self.container.create_item(product)
+                record_success(product)
                 
-            except (ValueError, TypeError, KeyError) as e:
+            except (CosmosHttpResponseError, ValueError, TypeError, KeyError) as e:
                 stats['failed'] += 1
                 error_msg = f"Failed to insert {product.get('name', 'Unknown')} (ID: {product.get('id', 'Unknown')}): {str(e)}"
                 stats['errors'].append(error_msg)
-                print(f"✗ {error_msg}")
+                logger.warning("%s", error_msg)
+        
+        async def insert_unbatched(product: Dict[str, Any]):
+            async with semaphore:
+                await insert_one(product)
         
+        async def insert_batch(category: Any, batch: List[Dict[str, Any]]):
+            async with semaphore:
+                try:
+                    await self.container.execute_item_batch(
+                        [("create", (product,), {}) for product in batch],
+                        partition_key=category
+                    )
+                except (CosmosBatchOperationError, CosmosHttpResponseError) as e:
+                    # Batches are transactional, so nothing was written; retry item by
+                    # item to insert the valid products and report the failing ones.
+                    logger.warning("Batch for category '%s' failed (%s), retrying individually", category, e)
+                    for product in batch:
+                        await insert_one(product)
+                    return
+                for product in batch:
+                    record_success(product)
+        
+        # The container is partitioned on /category, so group products by category
+        # and write each group in transactional batches of up to 100 operations.
+        # A batch needs an explicit partition key value, and None does not address
+        # the partition of documents without a category, so those are inserted one
+        # by one and create_item takes the partition key from the document itself.
+        groups: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+        uncategorized: List[Dict[str, Any]] = []
+        for product in products:
+            if product.get('category') is None:
+                uncategorized.append(product)
+            else:
+                groups[product['category']].append(product)
+        
+        await asyncio.gather(
+            *(
+                insert_batch(category, group[start:start + MAX_BATCH_OPERATIONS])
+                for category, group in groups.items()
+                for start in range(0, len(group), MAX_BATCH_OPERATIONS)
+            ),
+            *(insert_unbatched(product) for product in uncategorized)
+        )
+        logger.info("Inserted %s products, %s failed", stats['successful'], stats['failed'])
         return stats
     
-    def query_products(self, query: str = "SELECT * FROM c") -> List[Dict[str, Any]]:
-        """Query products from the container."""
+    async def query_products(self, query: str = "SELECT * FROM c", category: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream products from the container as the query pages arrive.
+        
+        Passing a category routes the query to that single partition instead of
+        fanning out across all partitions.
+        """
         try:
-            items = list(self.container.query_items(
-                query=query,
-                enable_cross_partition_query=True
-            ))
-            print(f"Query returned {len(items)} items")
-            return items
+            async for item in self.container.query_items(query=query, partition_key=category):
+                yield item
         except (ValueError, TypeError, KeyError) as e:
             print(f"Error querying products: {e}")
             raise
     
-    def get_container_stats(self) -> Dict[str, Any]:
-        """Get basic statistics about the container."""
+    async def count_products(
+        self,
+        condition: Optional[str] = None,
+        parameters: Optional[List[Dict[str, Any]]] = None,
+        category: Optional[str] = None
+    ) -> int:
+        """Count products matching an optional SQL filter without fetching the documents.
+        
+        The condition is trusted SQL appended after WHERE; pass any values it compares
+        against as query parameters (e.g. "c.price > @price") instead of formatting them in.
+        """
+        query = "SELECT VALUE COUNT(1) FROM c"
+        if condition:
+            query += f" WHERE {condition}"
         try:
-            # Get container properties
-            container_props = self.container.read()
+            count_result = [
+                item async for item in self.container.query_items(query=query, parameters=parameters, partition_key=category)
+            ]
+            return count_result[0] if count_result else 0
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Error counting products: {e}")
+            raise
+    
+    async def get_container_stats(self) -> Dict[str, Any]:
+        """Get basic statistics about the container, reusing them for STATS_CACHE_TTL seconds."""
+        now = time.monotonic()
+        if self._stats_cache and now - self._stats_cache[0] < STATS_CACHE_TTL:
+            return self._stats_cache[1]
+        
+        try:
+            # Get container properties along with its quota usage headers
+            response: Dict[str, Any] = {}
+            container_props = await self.container.read(
+                populate_quota_info=True,
+                response_hook=lambda headers, _: response.setdefault('headers', headers)
+            )
             
-            # Count items
-            count_query = "SELECT VALUE COUNT(1) FROM c"
-            count_result = list(self.container.query_items(
-                query=count_query,
-                enable_cross_partition_query=True
-            ))
-            item_count = count_result[0] if count_result else 0
+            # Count items from the resource usage header (e.g. "documentsCount=10;...")
+            # instead of a cross-partition COUNT query; fall back to the query if absent
+            usage = response.get('headers', {}).get('x-ms-resource-usage', '')
+            quota = dict(part.split('=', 1) for part in usage.split(';') if '=' in part)
+            if 'documentsCount' in quota:
+                item_count = int(quota['documentsCount'])
+            else:
+                item_count = await self.count_products()
             
-            return {
+            stats = {
                 'container_id': container_props['id'],
                 'partition_key': container_props['partitionKey']['paths'],
                 'item_count': item_count,
                 'last_modified': container_props['lastModified']
             }
+            self._stats_cache = (now, stats)
+            return stats
         except (ValueError, TypeError, KeyError) as e:
             print(f"Error getting container stats: {e}")
             return {}
 
-def main():
+async def main():
     """Main function to insert products into Cosmos DB."""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     try:
         # Initialize the inserter
         inserter = CosmosDBProductInserter()
-        
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"❌ Error: {e}")
+        return 1
+    
+    try:
         # Create database and container
-        inserter.create_database_and_container()
+        await inserter.create_database_and_container()
         
         # Load products from JSON file
         products = inserter.load_products_from_json()
         
         # Insert products
         print("\nInserting products into Cosmos DB...")
-        stats = inserter.insert_products(products)
+        stats = await inserter.insert_products(products)
         
         # Print results
         print("\n=== Insertion Results ===")
@@ -178,32 +296,34 @@ def main():
         
         # Get and display container statistics
         print("\n=== Container Statistics ===")
-        container_stats = inserter.get_container_stats()
+        container_stats = await inserter.get_container_stats()
         for key, value in container_stats.items():
             print(f"{key}: {value}")
         
         # Example queries
         print("\n=== Example Queries ===")
         
-        # Query all products
-        all_products = inserter.query_products()
-        print(f"Total products in database: {len(all_products)}")
+        # Count all products
+        total = await inserter.count_products()
+        print(f"Total products in database: {total}")
         
-        # Query by category
-        electronics = inserter.query_products("SELECT * FROM c WHERE c.category = 'Electronics'")
-        print(f"Electronics products: {len(electronics)}")
+        # Count by category
+        electronics = await inserter.count_products(category='Electronics')
+        print(f"Electronics products: {electronics}")
         
-        # Query expensive products
-        expensive = inserter.query_products("SELECT * FROM c WHERE c.price > 1000")
-        print(f"Products over $1000: {len(expensive)}")
+        # Count expensive products
+        expensive = await inserter.count_products("c.price > @price", [{"name": "@price", "value": 1000}])
+        print(f"Products over $1000: {expensive}")
         
         print("\n✅ Product insertion completed successfully!")
         
     except (ValueError, TypeError, KeyError) as e:
         print(f"❌ Error: {e}")
         return 1
+    finally:
+        await inserter.close()
     
     return 0
 
 if __name__ == "__main__":
-    exit(main()) 
\ No newline at end of file
+    exit(asyncio.run(main())) 
\ No newline at end of file
@@ -1,4 +1,8 @@
 """Product schema information for Cosmos DB."""
+import json
+import re
+from types import MappingProxyType
+
 SCHEMA_INFO = '''
 Cosmos DB Product Schema:
 {
@@ -32,4 +36,34 @@ Cosmos DB Product Schema:
     "_attachments": string,
     "_ts": number
 }
-''' 
\ No newline at end of file
+'''
+
+def _parse_schema(schema_info: str) -> dict:
+    """Parse the schema template into a field -> type mapping.
+
+    The template uses bare type names (string, number, boolean), so they are
+    quoted to make the body valid JSON before loading it.
+    """
+    body = schema_info[schema_info.index('{'):]
+    body = re.sub(r'\b(string|number|boolean)\b', r'"\1"', body)
+    return json.loads(body)
+
+# Parsed once at import so callers get O(1) field lookups without re-parsing
+SCHEMA_DICT = MappingProxyType(_parse_schema(SCHEMA_INFO))
+
+# Fields the search query generator may filter or sort on. System properties
+# (_rid, _etag, ...), images, SKUs and timestamps are never useful in a search
+# predicate, so they are left out of the prompt to save tokens.
+QUERY_FIELDS = (
+    "id", "name", "category", "subcategory", "brand", "description", "price",
+    "currency", "inStock", "stockQuantity", "tags", "specifications", "rating",
+    "reviewCount",
+)
+
+def render_schema(fields) -> str:
+    """Render a compact schema description restricted to the given fields."""
+    subset = {field: SCHEMA_DICT[field] for field in fields}
+    return f"Cosmos DB Product Schema:\n{json.dumps(subset, separators=(', ', ': '))}"
+
+# Minimized schema for the query generation prompt, rendered once at import
+QUERY_SCHEMA_INFO = render_schema(QUERY_FIELDS)
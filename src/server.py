@@ -1,129 +1,255 @@
 """MCP server for Cosmos DB CRUD operations on products database."""
 
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Set
+import atexit
+import contextlib
+import functools
 import os
+import queue
+import re
+import time
+from operator import itemgetter
 import logging
-from azure.cosmos import CosmosClient
-from azure.cosmos.exceptions import CosmosHttpResponseError
-from azure.identity import DefaultAzureCredential
+from logging.handlers import QueueHandler, QueueListener
+import uvicorn
+from cachetools import TTLCache
+from azure.cosmos.exceptions import CosmosClientTimeoutError, CosmosHttpResponseError
 from langgraph.prebuilt import create_react_agent
 
 from langchain_openai import AzureChatOpenAI
 from mcp.server.fastmcp import FastMCP
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 from dotenv import load_dotenv
-from schema_info import SCHEMA_INFO
+from schema_info import QUERY_SCHEMA_INFO
+from db import close_client, get_config, get_container, get_database
 load_dotenv()
 
-# Configure logging
-LOG_DIR = "/app/logs" if os.path.exists("/app/logs") else "."
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
+def _configure_logging():
+    """Route all records through a queue to the console and log file.
+
+    A listener thread does the writes, so tool calls never block on log I/O.
+    Like logging.basicConfig, this does nothing if the root logger already has
+    handlers, so importing the module again (e.g. as both ``server`` and
+    ``src.server``) neither reopens server.log nor duplicates every record.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    log_dir = "/app/logs" if os.path.exists("/app/logs") else "."
+    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    log_handlers: List[logging.Handler] = [
         logging.StreamHandler(),
-        logging.FileHandler(f'{LOG_DIR}/server.log')
+        logging.FileHandler(f'{log_dir}/server.log')
     ]
-)
+    for handler in log_handlers:
+        handler.setFormatter(log_formatter)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, *log_handlers)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    root.setLevel(logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
+
+_configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize FastMCP server
 mcp = FastMCP("remote-db-mcp-server", host="0.0.0.0", port=8000)
 
-# Cosmos DB Configuration
-COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT")
-DATABASE_NAME = os.getenv("COSMOS_DATABASE", "products-db")
-CONTAINER_NAME = os.getenv("COSMOS_CONTAINER", "products")
-
-# Initialize Cosmos DB client
-if not COSMOS_ENDPOINT:
-    logger.error("COSMOS_ENDPOINT environment variable is not set")
-    raise ValueError("COSMOS_ENDPOINT environment variables must be set")
-
-try:
-    cosmos_client = CosmosClient(COSMOS_ENDPOINT, credential=DefaultAzureCredential())
-    database = cosmos_client.get_database_client(DATABASE_NAME)
-    container = database.get_container_client(CONTAINER_NAME)
-    logger.info("Successfully connected to Cosmos DB")
-except Exception as e:
-    logger.error("Failed to connect to Cosmos DB: %s", str(e))
-    raise
-
-llm = AzureChatOpenAI(
-    azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
-    temperature=0,
-)
-
 query_prompt = f"""
 You are a Cosmos DB query assistant. Based on user requests, generate appropriate Cosmos DB SQL queries.
-{SCHEMA_INFO}
+{QUERY_SCHEMA_INFO}
 
 Analyze the user query, determine what product information they need, and formulate a Cosmos DB SQL query string.
 
 IMPORTANT: Return ONLY the SQL query string without any additional text, markdown formatting, or code blocks.
+Always select only the fields c.id, c.name and c.price.
 
 For example:
-- For searching by name: SELECT * FROM c WHERE CONTAINS(c.name, 'MacBook', true)
-- For filtering by price: SELECT * FROM c WHERE c.price < 1000
+- For searching by name: SELECT c.id, c.name, c.price FROM c WHERE CONTAINS(c.name, 'MacBook', true)
+- For filtering by price: SELECT c.id, c.name, c.price FROM c WHERE c.price < 1000
 
 Be specific and precise with your queries.
 """
 
+@functools.lru_cache(maxsize=1)
+def get_query_agent():
+    """Build the query-generation agent on first use and reuse it across requests."""
+    llm = AzureChatOpenAI(
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+        temperature=0,
+    )
+    return create_react_agent(
+        llm,
+        tools=[],
+        prompt=query_prompt,
+    )
+
+# Static substring search used for plain search terms without invoking the LLM.
+# Only the fields rendered in the response are projected, which keeps payloads
+# and RU charges small compared to SELECT *.
+SEARCH_SQL = (
+    "SELECT TOP @limit c.id, c.name, c.price FROM c "
+    "WHERE CONTAINS(c.name, @query, true) OR CONTAINS(c.description, @query, true)"
+)
+
+# Queries with comparisons or price/rating/stock constraints need the LLM to build the SQL
+LLM_QUERY_PATTERN = re.compile(
+    r"[<>=]|\b(price|under|over|between|below|above|cheaper|than|rating|stock)\b",
+    re.IGNORECASE,
+)
+
+# Result rows keyed by (normalized query, limit, category). Only the rows are cached;
+# the header is rendered from each request's own query text. Entries expire after a
+# minute so newly inserted products show up without a restart.
+search_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
+# Categories known to hold at least one product. A category missing from the set is
+# probed with a TOP 1 query routed to its own partition, so new categories are found
+# at once and empty ones are answered without the LLM fallback. Known categories skip
+# the probe; the set is never used to declare a category absent.
+known_categories: Set[str] = set()
+CATEGORY_PROBE_SQL = "SELECT TOP 1 VALUE c.id FROM c"
+
+async def _category_has_products(category: str) -> bool:
+    """Return whether the category's partition holds any product."""
+    if category in known_categories:
+        return True
+    async for _ in get_container().query_items(query=CATEGORY_PROBE_SQL, partition_key=category):
+        known_categories.add(category)
+        return True
+    return False
+
+def _normalize_query(query: str) -> str:
+    """Case-fold and collapse whitespace so trivially different queries share a cache entry."""
+    return " ".join(query.casefold().split())
+
+# Row formatter for search results: one C-level tuple fetch and one %-format per item
+format_product_row = "- %s (ID: %s, Price: $%s)".__mod__
+product_row_fields = itemgetter('name', 'id', 'price')
+
+def _format_search_response(query: str, lines: Sequence[str]) -> str:
+    """Render result rows under a header that echoes the caller's query."""
+    if not lines:
+        return f"No products found matching '{query}'."
+    return "\n".join([f"Found {len(lines)} products matching '{query}':", *lines])
+
+async def _query_product_lines(sql_query: str, parameters: List[Dict[str, object]], limit: int, category: Optional[str]) -> List[str]:
+    """Run a query against the products container and format each row as it arrives."""
+    lines: List[str] = []
+    # The container is partitioned on /category, so a known category is routed
+    # to a single partition instead of fanning out across all of them
+    async for item in get_container().query_items(
+        query=sql_query,
+        parameters=parameters,
+        partition_key=category,
+        max_item_count=limit
+    ):
+        lines.append(format_product_row(product_row_fields(item)))
+        # max_item_count is only a page size; stop once the limit is reached so
+        # further pages are never requested
+        if len(lines) >= limit:
+            break
+    return lines
+
 @mcp.tool()
-async def search_products(query: str, limit: int = 10) -> str:
+async def search_products(query: str, limit: int = 10, category: Optional[str] = None) -> str:
     """Search products by name or description.
 
     Args:
         query: Search term to look for in product names and descriptions
         limit: Maximum number of results to return (default: 10)
+        category: Optional exact product category to restrict the search to
     """
+    if limit < 1:
+        # TOP 0 would force the LLM fallback and a negative TOP is rejected by Cosmos DB
+        logger.error("Invalid search limit %s for query: '%s'", limit, query)
+        return f"Invalid search query: limit must be at least 1, got {limit}"
+    cache_key = (_normalize_query(query), limit, category)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Serving cached search results for query: '%s'", query)
+        return _format_search_response(query, cached)
     try:
-        agent = create_react_agent(
-            llm,
-            tools=[],
-            prompt=query_prompt,
-        )
-        result = await agent.ainvoke({"messages": [("user", query)]})
-        sql_query = result["messages"][-1].content
-        parameters: List[Dict[str, object]] = [{"name": "@query", "value": query}]
-        items = list(container.query_items(
-            query=sql_query,
-            parameters=parameters,
-            max_item_count=limit,
-            enable_cross_partition_query=True
-        ))
-        logger.info("Search returned %s results for query: '%s'", len(items), query)
-        if not items:
+        if category is not None and not await _category_has_products(category):
+            logger.info("No products in category '%s' for query: '%s'", category, query)
+            return _format_search_response(query, ())
+        parameters: List[Dict[str, object]] = [
+            {"name": "@query", "value": query},
+            {"name": "@limit", "value": limit},
+        ]
+        lines: List[str] = []
+        if not LLM_QUERY_PATTERN.search(query):
+            lines = await _query_product_lines(SEARCH_SQL, parameters, limit, category)
+        if not lines:
+            # Fall back to LLM-generated SQL for structured queries or when the
+            # plain substring search finds nothing
+            result = await get_query_agent().ainvoke({"messages": [("user", query)]})
+            sql_query = result["messages"][-1].content
+            lines = await _query_product_lines(sql_query, parameters, limit, category)
+        logger.info("Search returned %s results for query: '%s'", len(lines), query)
+        if not lines:
             logger.info("No products found matching query: '%s'", query)
-            return f"No products found matching '{query}'."
-        result = f"Found {len(items)} products matching '{query}':\n"
-        for item in items:
-            result += f"- {item['name']} (ID: {item['id']}, Price: ${item['price']})\n"
-        
-        return result
+        search_cache[cache_key] = tuple(lines)
+        return _format_search_response(query, lines)
     except CosmosHttpResponseError as e:
         logger.error("CosmosHttpResponseError searching products: %s", str(e))
         return f"Error searching products: {str(e)}"
+    except CosmosClientTimeoutError as e:
+        logger.error("Timed out searching products: %s", str(e))
+        return f"Error searching products: {str(e)}"
     except ValueError as e:
         logger.error("ValueError searching products: %s", str(e))
         return f"Invalid search query: {str(e)}"
 
+# Seconds for which a successful Cosmos DB health probe is reused
+HEALTH_CACHE_TTL = 5.0
+last_healthy_at = float("-inf")
+
 # Add health check endpoint
 @mcp.custom_route("/health", methods=["GET"])
-async def health_check():
+async def health_check(request: Request) -> JSONResponse:
     """Health check endpoint for Azure Container Apps"""
+    global last_healthy_at
+    now = time.monotonic()
+    if now - last_healthy_at < HEALTH_CACHE_TTL:
+        return JSONResponse({"status": "healthy", "cosmos_db": "cached"})
     try:
         # Simple check to verify Cosmos DB connection
-        database.read()
-        return {"status": "healthy", "cosmos_db": "connected"}
-    except CosmosHttpResponseError as e:
+        await get_database().read()
+        last_healthy_at = now
+        return JSONResponse({"status": "healthy", "cosmos_db": "connected"})
+    except (CosmosHttpResponseError, CosmosClientTimeoutError) as e:
         logger.error("Health check failed: %s", e)
-        return {"status": "unhealthy", "error": str(e)}, 503
+        return JSONResponse({"status": "unhealthy", "error": str(e)}, status_code=503)
+
+def create_app() -> Starlette:
+    """Build the streamable HTTP app, closing the shared Cosmos DB client on shutdown."""
+    app = mcp.streamable_http_app()
+    session_lifespan = app.router.lifespan_context
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        async with session_lifespan(app):
+            try:
+                yield
+            finally:
+                # Close the client, its aiohttp session and credential on the serving loop
+                await close_client()
+
+    app.router.lifespan_context = lifespan
+    return app
 
 if __name__ == "__main__":
     logger.info("Starting MCP server")
     try:
-        mcp.run(transport="streamable-http", host="0.0.0.0", port=8000, path="/mcptest")
+        # Importing the module has no side effects on Azure; validate the
+        # configuration here so a misconfigured server fails at startup
+        get_config()
+        uvicorn.run(create_app(), host=mcp.settings.host, port=mcp.settings.port)
         logger.info("MCP server started successfully")
     except (OSError, RuntimeError, ValueError) as e:
         logger.error("Failed to start MCP server: %s", str(e))
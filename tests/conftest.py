@@ -0,0 +1,7 @@
+"""Shared test setup."""
+
+import logging
+
+# server.py only sets up its queue listener and server.log when the root logger has
+# no handlers, so install one to keep imports under test from writing log files
+logging.getLogger().addHandler(logging.NullHandler())
@@ -0,0 +1,196 @@
+"""Tests for the MCP client's tool schema cache, semantic cache and query streaming."""
+
+import json
+import os
+import time
+
+import pytest
+from langchain_core.messages import AIMessageChunk, ToolMessage
+
+import client
+from client import MCPClient, SemanticCache, _load_tools_cache, _save_tools_cache
+
+
+class FakeTool:
+    """Stand-in for a LangChain tool with a JSON schema."""
+
+    def __init__(self, name, args_schema=None):
+        self.name = name
+        self.description = f"{name} description"
+        self.args_schema = args_schema or {"type": "object", "properties": {"query": {"type": "string"}}}
+
+
+class FakeEmbeddings:
+    """Embeddings stub that maps each query to a fixed vector."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    async def aembed_query(self, query):
+        return self.vectors[query]
+
+
+class FakeAgent:
+    """Agent stub that replays (message chunk, metadata) pairs from astream."""
+
+    def __init__(self, events):
+        self.events = events
+        self.runs = 0
+
+    async def astream(self, inputs, config=None, stream_mode=None):
+        self.runs += 1
+        for event in self.events:
+            yield event
+
+
+def ai(content, step, **kwargs):
+    return AIMessageChunk(content=content, **kwargs), {"langgraph_step": step}
+
+
+TOOL_CALLING_RUN = [
+    ai("Let me look that up. ", 1),
+    ai("", 1, tool_call_chunks=[{"name": "search_products", "args": '{"query": "MacBook"}', "id": "call-1", "index": 0}]),
+    (ToolMessage(content="- MacBook Pro (ID: 1, Price: $1999)", tool_call_id="call-1"), {"langgraph_step": 2}),
+    ai("The MacBook Pro ", 3),
+    ai("costs $1999.", 3),
+]
+
+
+@pytest.fixture
+def mcp_client(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "test-key")
+    monkeypatch.delenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", raising=False)
+    return MCPClient()
+
+
+async def collect(mcp_client, query):
+    return [token async for token in mcp_client.process_query(query)]
+
+
+class TestToolsCache:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "mcp" / "tools.json")
+        _save_tools_cache(path, [FakeTool("search_products")])
+
+        specs = _load_tools_cache(path)
+
+        assert specs == [{
+            "name": "search_products",
+            "description": "search_products description",
+            "args_schema": {"type": "object", "properties": {"query": {"type": "string"}}},
+        }]
+
+    def test_expires_after_ttl(self, tmp_path):
+        path = str(tmp_path / "tools.json")
+        _save_tools_cache(path, [FakeTool("search_products")])
+
+        fresh = time.time() - client.TOOLS_CACHE_TTL + 60
+        os.utime(path, (fresh, fresh))
+        assert _load_tools_cache(path) is not None
+
+        stale = time.time() - client.TOOLS_CACHE_TTL - 1
+        os.utime(path, (stale, stale))
+        assert _load_tools_cache(path) is None
+
+    def test_missing_file_is_a_miss(self, tmp_path):
+        assert _load_tools_cache(str(tmp_path / "missing.json")) is None
+
+    @pytest.mark.parametrize("content", ['[{"name": "search_products"', '{"name": "x"}', '[{"name": "x"}]'])
+    def test_unreadable_file_is_a_miss(self, tmp_path, content):
+        path = tmp_path / "tools.json"
+        path.write_text(content, encoding="utf-8")
+
+        assert _load_tools_cache(str(path)) is None
+
+    def test_write_is_atomic(self, tmp_path):
+        path = str(tmp_path / "tools.json")
+        _save_tools_cache(path, [FakeTool("search_products")])
+
+        # A schema that cannot be serialized fails part way through the write
+        _save_tools_cache(path, [FakeTool("broken", {"default": object()})])
+
+        assert [spec["name"] for spec in _load_tools_cache(path)] == ["search_products"]
+        assert os.listdir(tmp_path) == ["tools.json"]
+        with open(path, encoding="utf-8") as file:
+            json.load(file)
+
+
+class TestSemanticCache:
+    def test_lookup_uses_cosine_threshold(self):
+        cache = SemanticCache(embeddings=None, threshold=0.95)
+        cache.store(1, [1.0, 0.0], "cached answer")
+
+        assert cache.lookup(1, [1.0, 0.0]) == "cached answer"
+        assert cache.lookup(1, [0.96, 0.28]) == "cached answer"
+        assert cache.lookup(1, [0.9, 0.436]) is None
+
+    def test_lookup_is_scoped_to_tools_fingerprint(self):
+        cache = SemanticCache(embeddings=None)
+        cache.store(1, [1.0, 0.0], "cached answer")
+
+        assert cache.lookup(2, [1.0, 0.0]) is None
+
+    def test_entries_expire_after_ttl(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(client.time, "monotonic", lambda: now[0])
+        cache = SemanticCache(embeddings=None, ttl=60.0)
+        cache.store(1, [1.0, 0.0], "cached answer")
+
+        now[0] += 59
+        assert cache.lookup(1, [1.0, 0.0]) == "cached answer"
+        now[0] += 2
+        assert cache.lookup(1, [1.0, 0.0]) is None
+
+    def test_evicts_least_recently_used(self):
+        cache = SemanticCache(embeddings=None, maxsize=2)
+        cache.store(1, [1.0, 0.0], "a")
+        cache.store(1, [0.0, 1.0], "b")
+        assert cache.lookup(1, [1.0, 0.0]) == "a"
+
+        cache.store(1, [-1.0, 0.0], "c")
+
+        assert cache.lookup(1, [0.0, 1.0]) is None
+        assert cache.lookup(1, [1.0, 0.0]) == "a"
+        assert cache.lookup(1, [-1.0, 0.0]) == "c"
+
+    @pytest.mark.asyncio
+    async def test_embed_normalizes_vectors(self):
+        cache = SemanticCache(FakeEmbeddings({"query": [3.0, 4.0]}))
+
+        assert await cache.embed("query") == pytest.approx([0.6, 0.8])
+
+
+class TestProcessQuery:
+    @pytest.mark.asyncio
+    async def test_yields_only_the_final_step(self, mcp_client):
+        mcp_client.agent = FakeAgent(TOOL_CALLING_RUN)
+
+        assert await collect(mcp_client, "How much is the MacBook?") == ["The MacBook Pro costs $1999."]
+
+    @pytest.mark.asyncio
+    async def test_run_ending_in_tool_calls_has_no_answer(self, mcp_client):
+        mcp_client.agent = FakeAgent(TOOL_CALLING_RUN[:2])
+
+        assert await collect(mcp_client, "How much is the MacBook?") == ["No response generated"]
+
+    @pytest.mark.asyncio
+    async def test_semantic_cache_stores_only_the_final_answer(self, mcp_client):
+        mcp_client.semantic_cache = SemanticCache(FakeEmbeddings({
+            "How much is the MacBook?": [1.0, 0.0],
+            "how much is the macbook": [1.0, 0.0],
+        }))
+        mcp_client.agent = FakeAgent(TOOL_CALLING_RUN)
+
+        await collect(mcp_client, "How much is the MacBook?")
+        cached = await collect(mcp_client, "how much is the macbook")
+
+        assert cached == ["The MacBook Pro costs $1999."]
+        assert mcp_client.agent.runs == 1
+
+    @pytest.mark.asyncio
+    async def test_embedding_failure_falls_back_to_the_agent(self, mcp_client):
+        mcp_client.semantic_cache = SemanticCache(FakeEmbeddings({}))
+        mcp_client.agent = FakeAgent(TOOL_CALLING_RUN)
+
+        assert await collect(mcp_client, "How much is the MacBook?") == ["The MacBook Pro costs $1999."]
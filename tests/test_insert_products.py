@@ -0,0 +1,88 @@
+"""Tests for batched product inserts."""
+
+import pytest
+import pytest_asyncio
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError
+
+from insert_products import MAX_BATCH_OPERATIONS, CosmosDBProductInserter
+
+
+def make_products(category, count):
+    prefix = category or "none"
+    products = [{"id": f"{prefix}-{i}", "name": f"{prefix} {i}"} for i in range(count)]
+    if category is not None:
+        for product in products:
+            product["category"] = category
+    return products
+
+
+class FakeContainer:
+    """Container stub that records batch and single-item writes."""
+
+    def __init__(self, failing_batches=(), failing_ids=()):
+        self.failing_batches = set(failing_batches)
+        self.failing_ids = set(failing_ids)
+        self.batches = []
+        self.created = []
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        self.batches.append((partition_key, len(batch_operations)))
+        if partition_key in self.failing_batches:
+            raise CosmosBatchOperationError(error_index=0, headers={}, status_code=409, message="Conflict")
+
+    async def create_item(self, body):
+        if body["id"] in self.failing_ids:
+            raise CosmosHttpResponseError(status_code=409, message="Conflict")
+        self.created.append(body["id"])
+
+
+@pytest_asyncio.fixture
+async def inserter(monkeypatch):
+    monkeypatch.setenv("COSMOS_ENDPOINT", "https://example.documents.azure.com:443/")
+    monkeypatch.setenv("COSMOS_KEY", "dGVzdA==")
+    inserter = CosmosDBProductInserter()
+    yield inserter
+    await inserter.close()
+
+
+@pytest.mark.asyncio
+async def test_products_are_batched_per_category(inserter):
+    inserter.container = FakeContainer()
+    products = make_products("Laptops", 2 * MAX_BATCH_OPERATIONS + 50) + make_products("Phones", 30)
+
+    stats = await inserter.insert_products(products)
+
+    assert sorted(inserter.container.batches) == [
+        ("Laptops", 50),
+        ("Laptops", MAX_BATCH_OPERATIONS),
+        ("Laptops", MAX_BATCH_OPERATIONS),
+        ("Phones", 30),
+    ]
+    assert inserter.container.created == []
+    assert stats == {"successful": len(products), "failed": 0, "errors": []}
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_item_by_item(inserter):
+    inserter.container = FakeContainer(failing_batches={"Phones"}, failing_ids={"Phones-1"})
+    products = make_products("Laptops", 5) + make_products("Phones", 3)
+
+    stats = await inserter.insert_products(products)
+
+    assert sorted(inserter.container.created) == ["Phones-0", "Phones-2"]
+    assert stats["successful"] == 7
+    assert stats["failed"] == 1
+    assert len(stats["errors"]) == 1
+    assert "Phones-1" in stats["errors"][0]
+
+
+@pytest.mark.asyncio
+async def test_products_without_category_are_not_batched(inserter):
+    inserter.container = FakeContainer()
+    products = make_products("Laptops", 2) + make_products(None, 2)
+
+    stats = await inserter.insert_products(products)
+
+    assert inserter.container.batches == [("Laptops", 2)]
+    assert sorted(inserter.container.created) == ["none-0", "none-1"]
+    assert stats["successful"] == 4
@@ -0,0 +1,178 @@
+"""Tests for search_products query routing, validation and caching."""
+
+import pytest
+from cachetools import TTLCache
+from langchain_core.messages import AIMessage
+
+import server
+from server import LLM_QUERY_PATTERN, SEARCH_SQL, _normalize_query, search_products
+
+MACBOOK = {"id": "1", "name": "MacBook Pro", "price": 1999}
+IPHONE = {"id": "2", "name": "iPhone 15", "price": 799}
+LLM_SQL = "SELECT c.id, c.name, c.price FROM c WHERE c.price < 500"
+
+
+class FakeContainer:
+    """Container stub that answers query_items from a {sql: rows} mapping."""
+
+    def __init__(self, results):
+        self.results = results
+        self.queries = []
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None):
+        self.queries.append((query, partition_key))
+        rows = self.results.get(query, [])
+
+        async def items():
+            for row in rows:
+                yield row
+
+        return items()
+
+
+class FakeQueryAgent:
+    """Query agent stub that always answers with the same SQL."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        return {"messages": [AIMessage(content=self.sql)]}
+
+
+@pytest.fixture
+def container(monkeypatch):
+    container = FakeContainer({})
+    monkeypatch.setattr(server, "get_container", lambda: container)
+    return container
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = FakeQueryAgent(LLM_SQL)
+    monkeypatch.setattr(server, "get_query_agent", lambda: agent)
+    return agent
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(server, "search_cache", TTLCache(maxsize=16, ttl=60, timer=lambda: now[0]))
+    monkeypatch.setattr(server, "known_categories", set())
+    return now
+
+
+@pytest.mark.parametrize("query", ["laptops under $500", "price < 1000", "rating above 4", "in stock"])
+def test_structured_queries_need_the_llm(query):
+    assert LLM_QUERY_PATTERN.search(query)
+
+
+@pytest.mark.parametrize("query", ["MacBook", "wireless headphones", "Overture"])
+def test_plain_terms_skip_the_llm(query):
+    assert not LLM_QUERY_PATTERN.search(query)
+
+
+@pytest.mark.asyncio
+async def test_plain_query_uses_static_sql(container, agent):
+    container.results[SEARCH_SQL] = [MACBOOK]
+
+    response = await search_products("MacBook")
+
+    assert response == "Found 1 products matching 'MacBook':\n- MacBook Pro (ID: 1, Price: $1999)"
+    assert agent.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_structured_query_uses_llm_sql(container, agent):
+    container.results[LLM_SQL] = [IPHONE]
+
+    response = await search_products("phones under $500")
+
+    assert response.endswith("- iPhone 15 (ID: 2, Price: $799)")
+    assert [query for query, _ in container.queries] == [LLM_SQL]
+    assert agent.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_empty_static_search_falls_back_to_llm(container, agent):
+    container.results[LLM_SQL] = [IPHONE]
+
+    response = await search_products("iPhone")
+
+    assert response.startswith("Found 1 products matching 'iPhone':")
+    assert [query for query, _ in container.queries] == [SEARCH_SQL, LLM_SQL]
+    assert agent.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_results_are_capped_at_limit(container, agent):
+    container.results[SEARCH_SQL] = [MACBOOK, IPHONE]
+
+    response = await search_products("Apple", limit=1)
+
+    assert response == "Found 1 products matching 'Apple':\n- MacBook Pro (ID: 1, Price: $1999)"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [0, -1])
+async def test_limit_below_one_is_rejected(container, agent, limit):
+    response = await search_products("MacBook", limit=limit)
+
+    assert response == f"Invalid search query: limit must be at least 1, got {limit}"
+    assert container.queries == []
+    assert agent.calls == 0
+
+
+def test_normalize_query():
+    assert _normalize_query("  MacBook\tPRO  16 ") == "macbook pro 16"
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_echoes_the_callers_query(container, agent):
+    container.results[SEARCH_SQL] = [MACBOOK]
+    await search_products("MacBook  Pro")
+
+    response = await search_products("macbook pro")
+
+    assert response == "Found 1 products matching 'macbook pro':\n- MacBook Pro (ID: 1, Price: $1999)"
+    assert len(container.queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_entries_expire(container, agent, clock):
+    container.results[SEARCH_SQL] = [MACBOOK]
+    await search_products("MacBook")
+
+    clock[0] += 59
+    await search_products("MacBook")
+    assert len(container.queries) == 1
+
+    clock[0] += 2
+    await search_products("MacBook")
+    assert len(container.queries) == 2
+
+
+@pytest.mark.asyncio
+async def test_empty_category_skips_the_llm(container, agent):
+    response = await search_products("MacBook", category="Typo")
+
+    assert response == "No products found matching 'MacBook'."
+    assert container.queries == [(server.CATEGORY_PROBE_SQL, "Typo")]
+    assert agent.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_new_category_is_probed_then_remembered(container, agent):
+    container.results[server.CATEGORY_PROBE_SQL] = ["1"]
+    container.results[SEARCH_SQL] = [MACBOOK]
+
+    await search_products("MacBook", category="Laptops")
+    await search_products("Pro", category="Laptops")
+
+    assert container.queries == [
+        (server.CATEGORY_PROBE_SQL, "Laptops"),
+        (SEARCH_SQL, "Laptops"),
+        (SEARCH_SQL, "Laptops"),
+    ]